@@ -221,6 +221,19 @@ class Backend(object):
         output_buffer.write(''.join(self.output))
         self.output = original_output
 
+    def render_to_string(self, render):
+        # type: (typing.Callable[[], None]) -> typing.Text
+        """
+        Calls render, which emits code, and returns the emitted code as it
+        would be written to a file. The output buffer is cleared before and
+        after.
+        """
+        self.clear_output_buffer()
+        render()
+        rendered = self.output_buffer_to_string()
+        self.clear_output_buffer()
+        return rendered
+
     def emit_raw(self, s):
         # type: (typing.Text) -> None
         """
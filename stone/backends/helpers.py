@@ -1,6 +1,13 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import multiprocessing
 import re
+import sys
+import traceback
+
+_MYPY = False
+if _MYPY:
+    import typing  # noqa: F401 # pylint: disable=import-error,unused-import,useless-suppression
 
 _split_words_capitalization_re = re.compile(
     '^[a-z0-9]+|[A-Z][a-z0-9]+|[A-Z]+(?=[A-Z][a-z0-9])|[A-Z]+$'
@@ -57,3 +64,71 @@ def fmt_underscores(name):
     capitalization, dashes, and underscores.
     """
     return '_'.join([word.lower() for word in split_words(name)])
+
+
+def add_jobs_argument(cmdline_parser):
+    # type: (typing.Any) -> None
+    """
+    Adds the -j/--jobs argument, for backends that render namespaces with
+    parallel_map, to the backend's argument parser.
+    """
+    cmdline_parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=1,
+        help=('Number of processes to generate namespaces with. Only used on '
+              'Linux. Defaults to 1, which generates them in this process.'),
+    )
+
+
+def parallel_map(func, items, jobs=1):
+    # type: (typing.Callable[[typing.Any], typing.Any], typing.Iterable, int) -> typing.List
+    """
+    Returns [func(item) for item in items].
+
+    If jobs is more than 1, the items are split between up to that many
+    forked worker processes. Workers inherit func and everything it refers to
+    from this process, so only their results are pickled. Forking is only
+    done on Linux; elsewhere, or when jobs is 1, the items are mapped in this
+    process.
+    """
+    items = list(items)
+    jobs = min(jobs, len(items))
+    if jobs <= 1 or not sys.platform.startswith('linux'):
+        return [func(item) for item in items]
+
+    context = multiprocessing.get_context('fork')
+    workers = []
+    for i in range(jobs):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_map_in_worker, args=(func, items[i::jobs], sender))
+        process.start()
+        sender.close()
+        workers.append((process, receiver))
+
+    results = [None] * len(items)  # type: typing.List[typing.Any]
+    errors = []
+    for i, (process, receiver) in enumerate(workers):
+        try:
+            succeeded, value = receiver.recv()
+        except EOFError:
+            succeeded, value = False, 'Worker process exited without a result.'
+        receiver.close()
+        process.join()
+        if succeeded:
+            results[i::jobs] = value
+        else:
+            errors.append(value)
+    if errors:
+        raise RuntimeError('Worker process failed:\n%s' % errors[0])
+    return results
+
+
+def _map_in_worker(func, items, conn):
+    try:
+        result = (True, [func(item) for item in items])
+    except Exception:  # pylint: disable=broad-except
+        result = (False, traceback.format_exc())
+    conn.send(result)
+    conn.close()
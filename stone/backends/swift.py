@@ -1,51 +1,28 @@
-from __future__ import absolute_import, division, print_function, unicode_literals
-
 from contextlib import contextmanager
+import textwrap
 
 from stone.ir import (
-    Boolean,
-    Bytes,
     DataType,
-    Float32,
-    Float64,
-    Int32,
-    Int64,
-    List,
-    String,
-    Timestamp,
-    UInt32,
-    UInt64,
-    Void,
-    is_list_type,
-    is_timestamp_type,
     is_union_type,
-    is_user_defined_type,
     unwrap_nullable,
 )
 from stone.backend import CodeBackend
-from stone.backends.swift_helpers import (
+from stone.backends.swift_helpers import (  # noqa: F401
     fmt_class,
     fmt_func,
     fmt_obj,
+    fmt_serial_obj,
+    fmt_serial_type,
     fmt_type,
     fmt_var,
 )
 
+_MYPY = False
+if _MYPY:
+    import typing  # noqa: F401 # pylint: disable=import-error,unused-import,useless-suppression
 
-_serial_type_table = {
-    Boolean: 'BoolSerializer',
-    Bytes: 'NSDataSerializer',
-    Float32: 'FloatSerializer',
-    Float64: 'DoubleSerializer',
-    Int32: 'Int32Serializer',
-    Int64: 'Int64Serializer',
-    List: 'ArraySerializer',
-    String: 'StringSerializer',
-    Timestamp: 'NSDateSerializer',
-    UInt32: 'UInt32Serializer',
-    UInt64: 'UInt64Serializer',
-    Void: 'VoidSerializer',
-}
+    # (name, value) pair of a Swift argument list.
+    ArgPair = typing.Tuple[typing.Text, typing.Any]
 
 
 stone_warning = """\
@@ -72,6 +49,100 @@ class SwiftBaseBackend(CodeBackend):
     """Wrapper class over Stone generator for Swift logic."""
     # pylint: disable=abstract-method
 
+    def __init__(self, *args, **kwargs):
+        # type: (...) -> None
+        super(SwiftBaseBackend, self).__init__(*args, **kwargs)
+        # The same data types are referenced over and over from fields, unions
+        # and routes. Data types hash by identity and live for the whole run,
+        # so their formatted names can be memoized on the data type itself.
+        self._type_cache = {}  # type: typing.Dict[DataType, typing.Text]
+        self._serial_type_cache = {}  # type: typing.Dict[DataType, typing.Text]
+        self._serial_obj_cache = {}  # type: typing.Dict[DataType, typing.Text]
+        self._init_args_cache = {}  # type: typing.Dict[DataType, typing.Tuple]
+        self._init_forward_args_cache = {}  # type: typing.Dict[DataType, typing.Tuple]
+        self._all_fields_cache = {}  # type: typing.Dict[DataType, typing.Tuple]
+        # Indentation prefix for the current level, refreshed by indent().
+        self._indent_str = ''
+        # Doc comment wrappers, keyed on indentation prefix.
+        self._doc_wrappers = {}  # type: typing.Dict[typing.Text, textwrap.TextWrapper]
+
+    def _all_fields(self, data_type):
+        """
+        Returns the fields of a struct or union including inherited ones, as
+        data_type.all_fields does. Struct.all_fields walks and filters the
+        whole parent chain on every access, so the result is kept per type.
+        """
+        all_fields = self._all_fields_cache.get(data_type)
+        if all_fields is None:
+            all_fields = self._all_fields_cache[data_type] = tuple(data_type.all_fields)
+        return all_fields
+
+    def _fmt_type(self, data_type):
+        result = self._type_cache.get(data_type)
+        if result is None:
+            result = self._type_cache[data_type] = fmt_type(data_type)
+        return result
+
+    def _fmt_serial_type(self, data_type):
+        result = self._serial_type_cache.get(data_type)
+        if result is None:
+            result = self._serial_type_cache[data_type] = fmt_serial_type(data_type)
+        return result
+
+    def _fmt_serial_obj(self, data_type):
+        result = self._serial_obj_cache.get(data_type)
+        if result is None:
+            result = self._serial_obj_cache[data_type] = fmt_serial_obj(data_type)
+        return result
+
+    @contextmanager
+    def indent(self, dent=None):
+        # type: (typing.Optional[int]) -> typing.Iterator[None]
+        with super(SwiftBaseBackend, self).indent(dent):
+            self._indent_str = self.make_indent()
+            yield
+        self._indent_str = self.make_indent()
+
+    def emit(self, s=''):
+        # type: (typing.Text) -> None
+        """
+        Same as :meth:`CodeBackend.emit`, but reuses the indentation prefix
+        cached by :meth:`indent` instead of rebuilding it for every line.
+        """
+        assert isinstance(s, str), 's must be a unicode string'
+        assert '\n' not in s, \
+            'String to emit cannot contain newline strings.'
+        self.emit_raw(self._indent_str + s + '\n' if s else '\n')
+
+    def emit_lines(self, lines):
+        # type: (typing.Iterable[typing.Text]) -> None
+        """
+        Emits each of the given lines at the current indentation, adding them
+        to the output buffer in one go. Empty lines get no indentation.
+        """
+        prefix = self._indent_str
+        self.emit_raw(''.join([prefix + line + '\n' if line else '\n' for line in lines]))
+
+    def emit_doc_comment(self, doc):
+        # type: (typing.Text) -> None
+        """
+        Emits doc as a `///` comment wrapped at 120 columns. Equivalent to
+        emit_wrapped_text(doc, prefix='/// ', width=120), but reuses one
+        TextWrapper per indentation level instead of building a new one for
+        every comment.
+        """
+        wrapper = self._doc_wrappers.get(self._indent_str)
+        if wrapper is None:
+            prefix = self._indent_str + '/// '
+            wrapper = self._doc_wrappers[self._indent_str] = textwrap.TextWrapper(
+                initial_indent=prefix,
+                subsequent_indent=prefix,
+                width=120,
+                break_long_words=False,
+                break_on_hyphens=False,
+            )
+        self.emit_raw(wrapper.fill(doc) + '\n')
+
     @contextmanager
     def function_block(self, func, args, return_type=None):
         signature = '{}({})'.format(func, args)
@@ -81,24 +152,24 @@ class SwiftBaseBackend(CodeBackend):
             yield
 
     def _func_args(self, args_list, newlines=False, force_first=False, not_init=False):
+        # type: (typing.Iterable[ArgPair], bool, bool, bool) -> typing.Text
+        args = iter(args_list)
         out = []
-        first = True
-        for k, v in args_list:
-            # this is a temporary hack -- injected client-side args
-            # do not have a separate field for default value. Right now,
-            # default values are stored along with the type, e.g.
-            # `Bool = True` is a type, hence this check.
-            if first and force_first and '=' not in v:
-                k = "{0} {0}".format(k)
-
-            if first and v is not None and not_init:
-                out.append('{}'.format(v))
-            elif v is not None:
-                out.append('{}: {}'.format(k, v))
-            first = False
-        sep = ', '
-        if newlines:
-            sep += '\n' + self.make_indent()
+        if force_first or not_init:
+            # Only the first argument is treated specially.
+            for k, v in args:
+                # this is a temporary hack -- injected client-side args
+                # do not have a separate field for default value. Right now,
+                # default values are stored along with the type, e.g.
+                # `Bool = True` is a type, hence this check.
+                if force_first and '=' not in v:
+                    k = '%s %s' % (k, k)
+
+                if v is not None:
+                    out.append(str(v) if not_init else '%s: %s' % (k, v))
+                break
+        out.extend(['%s: %s' % (k, v) for k, v in args if v is not None])
+        sep = ', \n' + self._indent_str if newlines else ', '
         return sep.join(out)
 
     @contextmanager
@@ -109,7 +180,7 @@ class SwiftBaseBackend(CodeBackend):
         if isinstance(thing, DataType):
             name = fmt_class(thing.name)
             if thing.parent_type:
-                extensions.append(fmt_type(thing.parent_type))
+                extensions.append(self._fmt_type(thing.parent_type))
         else:
             name = thing
         extensions.extend(protocols)
@@ -120,10 +191,29 @@ class SwiftBaseBackend(CodeBackend):
             yield
 
     def _struct_init_args(self, data_type, namespace=None):  # pylint: disable=unused-argument
+        args = self._init_args_cache.get(data_type)
+        if args is None:
+            args = self._init_args_cache[data_type] = tuple(
+                self._make_struct_init_args(data_type))
+        # Return a fresh list, callers append their own arguments to it.
+        return list(args)
+
+    def _struct_init_forward_args(self, data_type):
+        """
+        Returns `(name, name)` pairs that pass each struct init argument on
+        unchanged, e.g. to a super or struct initializer.
+        """
+        args = self._init_forward_args_cache.get(data_type)
+        if args is None:
+            args = self._init_forward_args_cache[data_type] = tuple(
+                (name, name) for name, _ in self._struct_init_args(data_type))
+        return list(args)
+
+    def _make_struct_init_args(self, data_type):
         args = []
-        for field in data_type.all_fields:
+        for field in self._all_fields(data_type):
             name = fmt_var(field.name)
-            value = fmt_type(field.data_type)
+            value = self._fmt_type(field.data_type)
             data_type, nullable = unwrap_nullable(field.data_type)
 
             if field.has_default:
@@ -157,38 +247,3 @@ class SwiftBaseBackend(CodeBackend):
             return val
         else:
             return val
-
-def fmt_serial_type(data_type):
-    data_type, nullable = unwrap_nullable(data_type)
-
-    if is_user_defined_type(data_type):
-        result = '{}.{}Serializer'
-        result = result.format(fmt_class(data_type.namespace.name),
-            fmt_class(data_type.name))
-    else:
-        result = _serial_type_table.get(data_type.__class__, fmt_class(data_type.name))
-
-        if is_list_type(data_type):
-            result = result + '<{}>'.format(fmt_serial_type(data_type.data_type))
-
-    return result if not nullable else 'NullableSerializer'
-
-
-def fmt_serial_obj(data_type):
-    data_type, nullable = unwrap_nullable(data_type)
-
-    if is_user_defined_type(data_type):
-        result = '{}.{}Serializer()'
-        result = result.format(fmt_class(data_type.namespace.name),
-            fmt_class(data_type.name))
-    else:
-        result = _serial_type_table.get(data_type.__class__, fmt_class(data_type.name))
-
-        if is_list_type(data_type):
-            result = result + '({})'.format(fmt_serial_obj(data_type.data_type))
-        elif is_timestamp_type(data_type):
-            result = result + '("{}")'.format(data_type.format)
-        else:
-            result = 'Serialization._{}'.format(result)
-
-    return result if not nullable else 'NullableSerializer({})'.format(result)
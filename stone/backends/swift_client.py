@@ -1,5 +1,3 @@
-from __future__ import absolute_import, division, print_function, unicode_literals
-
 import json
 
 from stone.ir import (
@@ -9,7 +7,6 @@ from stone.ir import (
 )
 from stone.backends.swift import (
     base,
-    fmt_serial_type,
     SwiftBaseBackend,
     undocumented,
 )
@@ -18,7 +15,6 @@ from stone.backends.swift_helpers import (
     fmt_class,
     fmt_func,
     fmt_var,
-    fmt_type,
 )
 
 _MYPY = False
@@ -79,6 +75,9 @@ _cmdline_parser.add_argument(
     help='The dict that maps a style type to a Swift request object name.',
 )
 
+_returns_doc = (' - returns: Through the response callback, the caller will '
+                'receive a `{}` object on success or a `{}` object on failure.')
+
 
 class SwiftBackend(SwiftBaseBackend):
     """
@@ -120,6 +119,14 @@ class SwiftBackend(SwiftBaseBackend):
 
     cmdline_parser = _cmdline_parser
 
+    def __init__(self, *args, **kwargs):
+        # type: (...) -> None
+        super(SwiftBackend, self).__init__(*args, **kwargs)
+        assert self.args is not None
+        # Parsed once here rather than for every route.
+        self._client_args = json.loads(self.args.client_args)
+        self._style_to_request = json.loads(self.args.style_to_request)
+
     def generate(self, api):
         for namespace in api.namespaces.values():
             ns_class = fmt_class(namespace.name)
@@ -173,7 +180,7 @@ class SwiftBackend(SwiftBaseBackend):
 
     def _get_route_args(self, namespace, route):
         data_type = route.arg_data_type
-        arg_type = fmt_type(data_type)
+        arg_type = self._fmt_type(data_type)
         if is_struct_type(data_type):
             arg_list = self._struct_init_args(data_type, namespace=namespace)
 
@@ -195,49 +202,42 @@ class SwiftBackend(SwiftBaseBackend):
         extra_args = extra_args or []
         extra_docs = extra_docs or []
 
-        arg_type = fmt_type(route.arg_data_type)
+        arg_type = self._fmt_type(route.arg_data_type)
         func_name = fmt_func(route.name, route.version)
 
         if route.doc:
             route_doc = self.process_doc(route.doc, self._docf)
         else:
             route_doc = 'The {} route'.format(func_name)
-        self.emit_wrapped_text(route_doc, prefix='/// ', width=120)
+        self.emit_doc_comment(route_doc)
         self.emit('///')
 
         for name, doc in doc_list + extra_docs:
             param_doc = '- parameter {}: {}'.format(name, doc if doc is not None else undocumented)
-            self.emit_wrapped_text(param_doc, prefix='/// ', width=120)
+            self.emit_doc_comment(param_doc)
         self.emit('///')
-        output = (' - returns: Through the response callback, the caller will ' +
-            'receive a `{}` object on success or a `{}` object on failure.')
-        output = output.format(fmt_type(route.result_data_type),
-                               fmt_type(route.error_data_type))
-        self.emit_wrapped_text(output, prefix='/// ', width=120)
-
-        func_args = [
-            ('route', '{}.{}'.format(fmt_class(namespace.name), func_name)),
-        ]
+        output = _returns_doc.format(self._fmt_type(route.result_data_type),
+                                     self._fmt_type(route.error_data_type))
+        self.emit_doc_comment(output)
+
         client_args = []
         return_args = [('route', 'route')]
 
         for name, value, typ in extra_args:
             arg_list.append((name, typ))
-            func_args.append((name, value))
             client_args.append((name, value))
 
-        rtype = fmt_serial_type(route.result_data_type)
-        etype = fmt_serial_type(route.error_data_type)
+        rtype = self._fmt_serial_type(route.result_data_type)
+        etype = self._fmt_serial_type(route.error_data_type)
 
         self._maybe_generate_deprecation_warning(route)
 
         with self.function_block('@discardableResult open func {}'.format(func_name),
                 args=self._func_args(arg_list, force_first=False),
                 return_type='{}<{}, {}>'.format(req_obj_name, rtype, etype)):
-            self.emit('let route = {}.{}'.format(fmt_class(namespace.name), func_name))
+            self.emit('let route = ' + fmt_class(namespace.name) + '.' + func_name)
             if is_struct_type(route.arg_data_type):
-                args = [(name, name) for name, _ in self._struct_init_args(route.arg_data_type)]
-                func_args += [('serverArgs', '{}({})'.format(arg_type, self._func_args(args)))]
+                args = self._struct_init_forward_args(route.arg_data_type)
                 self.emit('let serverArgs = {}({})'.format(arg_type, self._func_args(args)))
             elif is_union_type(route.arg_data_type):
                 self.emit('let serverArgs = {}'.format(fmt_var(route.arg_data_type.name)))
@@ -264,8 +264,8 @@ class SwiftBackend(SwiftBaseBackend):
 
     def _generate_route(self, namespace, route):
         route_type = route.attrs.get('style')
-        client_args = json.loads(self.args.client_args)
-        style_to_request = json.loads(self.args.style_to_request)
+        client_args = self._client_args
+        style_to_request = self._style_to_request
 
         if route_type not in client_args.keys():
             self._emit_route(namespace, route, style_to_request[route_type])
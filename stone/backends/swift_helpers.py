@@ -1,5 +1,4 @@
-from __future__ import absolute_import, division, print_function, unicode_literals
-
+import functools
 import pprint
 
 from stone.ir import (
@@ -10,6 +9,7 @@ from stone.ir import (
     Int32,
     Int64,
     List,
+    Nullable,
     String,
     Timestamp,
     UInt32,
@@ -20,11 +20,15 @@ from stone.ir import (
     is_numeric_type,
     is_string_type,
     is_tag_ref,
+    is_timestamp_type,
     is_user_defined_type,
-    unwrap_nullable,
 )
 from .helpers import split_words
 
+_MYPY = False
+if _MYPY:
+    import typing  # noqa: F401 # pylint: disable=import-error,unused-import,useless-suppression
+
 # This file defines *stylistic* choices for Swift
 # (ie, that class names are UpperCamelCase and that variables are lowerCamelCase)
 
@@ -44,6 +48,29 @@ _type_table = {
     Void: 'Void',
 }
 
+_serial_type_table = {
+    Boolean: 'BoolSerializer',
+    Bytes: 'NSDataSerializer',
+    Float32: 'FloatSerializer',
+    Float64: 'DoubleSerializer',
+    Int32: 'Int32Serializer',
+    Int64: 'Int64Serializer',
+    List: 'ArraySerializer',
+    String: 'StringSerializer',
+    Timestamp: 'NSDateSerializer',
+    UInt32: 'UInt32Serializer',
+    UInt64: 'UInt64Serializer',
+    Void: 'VoidSerializer',
+}
+
+# Serializer objects of the types above that take no parameters.
+_serial_obj_table = {
+    data_type: 'Serialization._' + serializer
+    for data_type, serializer in _serial_type_table.items()
+    if data_type not in (List, Timestamp)
+}
+
+
 _reserved_words = {
     'description',
     'bool',
@@ -95,7 +122,11 @@ def fmt_obj(o):
     return pprint.pformat(o, width=1)
 
 
+# Class, variable and function names are derived from the same handful of
+# spec names many times over, so the conversion is memoized.
+@functools.lru_cache(maxsize=None)
 def _format_camelcase(name, lower_first=True):
+    # type: (typing.Text, bool) -> typing.Text
     words = [word.capitalize() for word in split_words(name)]
     if lower_first:
         words[0] = words[0].lower()
@@ -106,10 +137,12 @@ def _format_camelcase(name, lower_first=True):
 
 
 def fmt_class(name):
+    # type: (typing.Text) -> typing.Text
     return _format_camelcase(name, lower_first=False)
 
 
 def fmt_func(name, version):
+    # type: (typing.Text, int) -> typing.Text
     if version > 1:
         name = '{}_v{}'.format(name, version)
     name = _format_camelcase(name)
@@ -117,21 +150,69 @@ def fmt_func(name, version):
 
 
 def fmt_type(data_type):
-    data_type, nullable = unwrap_nullable(data_type)
+    # type: (typing.Any) -> typing.Text
+    # Unwrapped inline rather than with unwrap_nullable(), this runs for every
+    # type reference.
+    nullable = data_type.__class__ is Nullable
+    if nullable:
+        data_type = data_type.data_type
+
+    result = _type_table.get(data_type.__class__)
+    if result is None:
+        if is_user_defined_type(data_type):
+            result = fmt_class(data_type.namespace.name) + '.' + fmt_class(data_type.name)
+        else:
+            result = fmt_class(data_type.name)
+    elif is_list_type(data_type):
+        result += '<' + fmt_type(data_type.data_type) + '>'
+
+    return result + '?' if nullable else result
 
-    if is_user_defined_type(data_type):
-        result = '{}.{}'.format(fmt_class(data_type.namespace.name),
-                                fmt_class(data_type.name))
-    else:
-        result = _type_table.get(data_type.__class__, fmt_class(data_type.name))
 
-        if is_list_type(data_type):
-            result = result + '<{}>'.format(fmt_type(data_type.data_type))
+def fmt_serial_type(data_type):
+    # type: (typing.Any) -> typing.Text
+    # Nullable is tested inline rather than with unwrap_nullable(), these
+    # formatters run for every serializer reference.
+    if data_type.__class__ is Nullable:
+        return 'NullableSerializer'
+
+    result = _serial_type_table.get(data_type.__class__)
+    if result is None:
+        if is_user_defined_type(data_type):
+            result = (fmt_class(data_type.namespace.name) + '.' +
+                      fmt_class(data_type.name) + 'Serializer')
+        else:
+            result = fmt_class(data_type.name)
+    elif is_list_type(data_type):
+        result += '<' + fmt_serial_type(data_type.data_type) + '>'
+
+    return result
+
+
+def fmt_serial_obj(data_type):
+    # type: (typing.Any) -> typing.Text
+    nullable = data_type.__class__ is Nullable
+    if nullable:
+        data_type = data_type.data_type
+
+    result = _serial_obj_table.get(data_type.__class__)
+    if result is None:
+        if is_user_defined_type(data_type):
+            result = (fmt_class(data_type.namespace.name) + '.' +
+                      fmt_class(data_type.name) + 'Serializer()')
+        elif is_list_type(data_type):
+            result = (_serial_type_table[List] + '(' +
+                      fmt_serial_obj(data_type.data_type) + ')')
+        elif is_timestamp_type(data_type):
+            result = _serial_type_table[Timestamp] + '("' + data_type.format + '")'
+        else:
+            result = 'Serialization._' + fmt_class(data_type.name)
 
-    return result if not nullable else result + '?'
+    return 'NullableSerializer(%s)' % result if nullable else result
 
 
 def fmt_var(name):
+    # type: (typing.Text) -> typing.Text
     return _format_camelcase(name)
 
 
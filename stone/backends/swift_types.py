@@ -1,32 +1,37 @@
-from __future__ import absolute_import, division, print_function, unicode_literals
-
 import json
 import os
 import shutil
-import six
 
 from contextlib import contextmanager
 
 from stone.ir import (
-    is_list_type,
-    is_numeric_type,
-    is_string_type,
+    Float32,
+    Float64,
+    Int32,
+    Int64,
+    List,
+    String,
+    Struct,
+    UInt32,
+    UInt64,
+    Union,
     is_struct_type,
-    is_union_type,
     is_void_type,
     unwrap_nullable,
 )
+from stone.backends.helpers import (
+    add_jobs_argument,
+    parallel_map,
+)
 from stone.backends.swift_helpers import (
     check_route_name_conflict,
     fmt_class,
     fmt_default_value,
     fmt_func,
     fmt_var,
-    fmt_type,
 )
 from stone.backends.swift import (
     base,
-    fmt_serial_obj,
     SwiftBaseBackend,
     undocumented,
 )
@@ -52,7 +57,16 @@ _cmdline_parser.add_argument(
           'given route; use {ns} as a placeholder for namespace name and '
           '{route} for the route name.'),
 )
+add_jobs_argument(_cmdline_parser)
+
+_numeric_types = (Float32, Float64, Int32, Int64, UInt32, UInt64)
+
+# Per-field lines of struct serializers and deserializers.
+_struct_serializer_field = '"%s": %s.serialize(value.%s),'
+_struct_deserializer_field = 'let %s = %s.deserialize(dict["%s"] ?? %s)'
 
+# Indentation of a case body relative to its switch in union (de)serializers.
+_case_indent = ' ' * 4
 
 class SwiftTypesBackend(SwiftBaseBackend):
     """
@@ -120,26 +134,43 @@ class SwiftTypesBackend(SwiftBaseBackend):
     """
 
     cmdline_parser = _cmdline_parser
+
+    def __init__(self, *args, **kwargs):
+        # type: (...) -> None
+        super(SwiftTypesBackend, self).__init__(*args, **kwargs)
+        self._validator_cache = {}  # type: typing.Dict[typing.Any, typing.Optional[typing.Text]]
+        self._field_serializers_cache = {}  # type: typing.Dict[typing.Any, typing.Tuple]
+        self._data_type_generators = {
+            Struct: self._generate_struct_class,
+            Union: self._generate_union_type,
+        }
+        # Validator builders keyed on the exact data type class; types without
+        # an entry are never validated.
+        self._validator_makers = {
+            List: self._make_array_validator,
+            String: self._make_string_validator,
+        }
+        self._validator_makers.update(
+            (numeric_type, self._make_comparable_validator) for numeric_type in _numeric_types)
+
     def generate(self, api):
         rsrc_folder = os.path.join(os.path.dirname(__file__), 'swift_rsrc')
-        self.logger.info('Copying StoneValidators.swift to output folder')
-        shutil.copy(os.path.join(rsrc_folder, 'StoneValidators.swift'),
-                    self.target_folder_path)
-        self.logger.info('Copying StoneSerializers.swift to output folder')
-        shutil.copy(os.path.join(rsrc_folder, 'StoneSerializers.swift'),
-                    self.target_folder_path)
-        self.logger.info('Copying StoneBase.swift to output folder')
-        shutil.copy(os.path.join(rsrc_folder, 'StoneBase.swift'),
-                    self.target_folder_path)
+        for rsrc_name in ('StoneValidators.swift', 'StoneSerializers.swift', 'StoneBase.swift'):
+            self.logger.info('Copying %s to output folder', rsrc_name)
+            # copyfile() lets the kernel move the bytes (sendfile) where available, and the
+            # resource permission bits that copy() would transfer are not needed.
+            shutil.copyfile(os.path.join(rsrc_folder, rsrc_name),
+                            os.path.join(self.target_folder_path, rsrc_name))
 
         jazzy_cfg_path = os.path.join('../Format', 'jazzy.json')
         with open(jazzy_cfg_path, encoding='utf-8') as jazzy_file:
             jazzy_cfg = json.load(jazzy_file)
 
-        for namespace in api.namespaces.values():
+        namespace_modules = self._render_namespace_modules(api)
+        for namespace, namespace_module in zip(api.namespaces.values(), namespace_modules):
             ns_class = fmt_class(namespace.name)
             with self.output_to_relative_path('{}.swift'.format(ns_class)):
-                self._generate_base_namespace_module(api, namespace)
+                self.emit_raw(namespace_module)
             jazzy_cfg['custom_categories'][1]['children'].append(ns_class)
 
             if namespace.routes:
@@ -148,19 +179,29 @@ class SwiftTypesBackend(SwiftBaseBackend):
         with self.output_to_relative_path('../../../../.jazzy.json'):
             self.emit_raw(json.dumps(jazzy_cfg, indent=2) + '\n')
 
+    def _render_namespace_modules(self, api):
+        """
+        Returns the generated module of every namespace, in namespace order.
+        """
+        return parallel_map(
+            lambda namespace: self.render_to_string(
+                lambda: self._generate_base_namespace_module(api, namespace)),
+            api.namespaces.values(),
+            self.args.jobs)
+
     def _generate_base_namespace_module(self, api, namespace):
         self.emit_raw(base)
 
         routes_base = 'Datatypes and serializers for the {} namespace'.format(namespace.name)
-        self.emit_wrapped_text(routes_base, prefix='/// ', width=120)
+        self.emit_doc_comment(routes_base)
 
         with self.block('open class {}'.format(fmt_class(namespace.name))):
+            # Dispatch in a single pass; the linearized order is kept so the
+            # output stays stable.
             for data_type in namespace.linearize_data_types():
-                if is_struct_type(data_type):
-                    self._generate_struct_class(namespace, data_type)
-                    self.emit()
-                elif is_union_type(data_type):
-                    self._generate_union_type(namespace, data_type)
+                generate_data_type = self._data_type_generators.get(data_type.__class__)
+                if generate_data_type:
+                    generate_data_type(namespace, data_type)
                     self.emit()
             if namespace.routes:
                 self._generate_route_objects(api.route_schema, namespace)
@@ -170,7 +211,7 @@ class SwiftTypesBackend(SwiftBaseBackend):
             doc = self.process_doc(data_type.doc, self._docf)
         else:
             doc = 'The {} struct'.format(fmt_class(data_type.name))
-        self.emit_wrapped_text(doc, prefix='/// ', width=120)
+        self.emit_doc_comment(doc)
         protocols = []
         if not data_type.parent_type:
             protocols.append('CustomStringConvertible')
@@ -179,10 +220,10 @@ class SwiftTypesBackend(SwiftBaseBackend):
             for field in data_type.fields:
                 fdoc = self.process_doc(field.doc,
                     self._docf) if field.doc else undocumented
-                self.emit_wrapped_text(fdoc, prefix='/// ', width=120)
+                self.emit_doc_comment(fdoc)
                 self.emit('public let {}: {}'.format(
                     fmt_var(field.name),
-                    fmt_type(field.data_type),
+                    self._fmt_type(field.data_type),
                 ))
             self._generate_struct_init(namespace, data_type)
 
@@ -208,50 +249,57 @@ class SwiftTypesBackend(SwiftBaseBackend):
                     self.emit('{}({})'.format(validator, v))
                 self.emit('self.{0} = {0}'.format(v))
             if data_type.parent_type:
-                func_args = [(fmt_var(f.name),
-                              fmt_var(f.name))
-                             for f in data_type.parent_type.all_fields]
+                func_args = self._struct_init_forward_args(data_type.parent_type)
                 self.emit('super.init({})'.format(self._func_args(func_args)))
 
     def _determine_validator_type(self, data_type, value):
+        # type: (typing.Any, typing.Text) -> typing.Optional[typing.Text]
+        # The validator only depends on the data type, so it is memoized on it.
+        # It may be None, hence the membership test rather than a .get().
+        if data_type not in self._validator_cache:
+            self._validator_cache[data_type] = self._make_validator_type(data_type, value)
+        return self._validator_cache[data_type]
+
+    def _make_validator_type(self, data_type, value):
         data_type, nullable = unwrap_nullable(data_type)
-        if is_list_type(data_type):
-            item_validator = self._determine_validator_type(data_type.data_type, value)
-            if item_validator:
-                v = "arrayValidator({})".format(
-                    self._func_args([
-                        ("minItems", data_type.min_items),
-                        ("maxItems", data_type.max_items),
-                        ("itemValidator", item_validator),
-                    ])
-                )
-            else:
-                return None
-        elif is_numeric_type(data_type):
-            v = "comparableValidator({})".format(
-                self._func_args([
-                    ("minValue", data_type.min_value),
-                    ("maxValue", data_type.max_value),
-                ])
-            )
-        elif is_string_type(data_type):
-            pat = data_type.pattern if data_type.pattern else None
-            pat = pat.encode('unicode_escape').replace(six.ensure_binary("\""),
-                                                       six.ensure_binary("\\\"")) if pat else pat
-            v = "stringValidator({})".format(
-                self._func_args([
-                    ("minLength", data_type.min_length),
-                    ("maxLength", data_type.max_length),
-                    ("pattern", '"{}"'.format(six.ensure_str(pat)) if pat else None),
-                ])
-            )
-        else:
-            return None
-
-        if nullable:
+        make_validator = self._validator_makers.get(data_type.__class__)
+        v = make_validator(data_type, value) if make_validator else None
+        if v and nullable:
             v = "nullableValidator({})".format(v)
         return v
 
+    def _make_array_validator(self, data_type, value):
+        item_validator = self._determine_validator_type(data_type.data_type, value)
+        if not item_validator:
+            return None
+        return "arrayValidator({})".format(
+            self._func_args([
+                ("minItems", data_type.min_items),
+                ("maxItems", data_type.max_items),
+                ("itemValidator", item_validator),
+            ])
+        )
+
+    def _make_comparable_validator(self, data_type, value):  # pylint: disable=unused-argument
+        return "comparableValidator({})".format(
+            self._func_args([
+                ("minValue", data_type.min_value),
+                ("maxValue", data_type.max_value),
+            ])
+        )
+
+    def _make_string_validator(self, data_type, value):  # pylint: disable=unused-argument
+        pat = data_type.pattern
+        if pat:
+            pat = pat.encode('unicode_escape').replace(b'"', b'\\"').decode('utf-8')
+        return "stringValidator({})".format(
+            self._func_args([
+                ("minLength", data_type.min_length),
+                ("maxLength", data_type.max_length),
+                ("pattern", '"{}"'.format(pat) if pat else None),
+            ])
+        )
+
     def _generate_enumerated_subtype_serializer(self, namespace,  # pylint: disable=unused-argument
             data_type):
         with self.block('switch value'):
@@ -261,12 +309,12 @@ class SwiftTypesBackend(SwiftBaseBackend):
                 tagvar = fmt_var(tag)
                 self.emit('case let {} as {}:'.format(
                     tagvar,
-                    fmt_type(subtype)
+                    self._fmt_type(subtype)
                 ))
 
                 with self.indent():
                     block_txt = 'for (k, v) in Serialization.getFields({}.serialize({}))'.format(
-                        fmt_serial_obj(subtype),
+                        self._fmt_serial_obj(subtype),
                         tagvar,
                     )
                     with self.block(block_txt):
@@ -274,23 +322,32 @@ class SwiftTypesBackend(SwiftBaseBackend):
                     self.emit('output[".tag"] = .str("{}")'.format(tag))
             self.emit('default: fatalError("Tried to serialize unexpected subtype")')
 
+    def _struct_field_serializers(self, data_type):
+        """
+        Returns a `(field, var name, serializer object)` triple for each of the
+        struct's fields, including inherited ones. The serializer and the
+        deserializer(s) of a struct share the same per-field values, so they
+        are resolved once per struct.
+        """
+        field_serializers = self._field_serializers_cache.get(data_type)
+        if field_serializers is None:
+            field_serializers = self._field_serializers_cache[data_type] = tuple(
+                (field, fmt_var(field.name), self._fmt_serial_obj(field.data_type))
+                for field in self._all_fields(data_type))
+        return field_serializers
+
     def _generate_struct_base_class_deserializer(self, namespace, data_type):
-        args = []
-        for field in data_type.all_fields:
-            var = fmt_var(field.name)
-            value = 'dict["{}"]'.format(field.name)
-            self.emit('let {} = {}.deserialize({} ?? {})'.format(
-                var,
-                fmt_serial_obj(field.data_type),
-                value,
-                fmt_default_value(namespace, field) if field.has_default else '.null'
-            ))
-
-            args.append((var, var))
-        self.emit('return {}({})'.format(
+        lines = [_struct_deserializer_field % (
+            var,
+            serial_obj,
+            field.name,
+            fmt_default_value(namespace, field) if field.has_default else '.null',
+        ) for field, var, serial_obj in self._struct_field_serializers(data_type)]
+        lines.append('return %s(%s)' % (
             fmt_class(data_type.name),
-            self._func_args(args)
+            self._func_args(self._struct_init_forward_args(data_type)),
         ))
+        self.emit_lines(lines)
 
     def _generate_enumerated_subtype_deserializer(self, namespace, data_type):
         self.emit('let tag = Serialization.getTag(dict)')
@@ -300,7 +357,7 @@ class SwiftTypesBackend(SwiftBaseBackend):
                 tag = tags[0]
                 self.emit('case "{}":'.format(tag))
                 with self.indent():
-                    self.emit('return {}.deserialize(json)'.format(fmt_serial_obj(subtype)))
+                    self.emit('return {}.deserialize(json)'.format(self._fmt_serial_obj(subtype)))
             self.emit('default:')
             with self.indent():
                 if data_type.is_catch_all():
@@ -311,25 +368,23 @@ class SwiftTypesBackend(SwiftBaseBackend):
     def _generate_struct_class_serializer(self, namespace, data_type):
         with self.serializer_block(data_type):
             with self.serializer_func(data_type):
-                if not data_type.all_fields:
+                if not self._all_fields(data_type):
                     self.emit('let output = [String: JSON]()')
                 else:
                     intro = 'var' if data_type.has_enumerated_subtypes() else 'let'
-                    self.emit("{} output = [ ".format(intro))
-                    for field in data_type.all_fields:
-                        self.emit('"{}": {}.serialize(value.{}),'.format(
-                            field.name,
-                            fmt_serial_obj(field.data_type),
-                            fmt_var(field.name)
-                        ))
-                    self.emit(']')
+                    lines = ['%s output = [ ' % intro]
+                    lines.extend(_struct_serializer_field % (field.name, serial_obj, var)
+                                 for field, var, serial_obj
+                                 in self._struct_field_serializers(data_type))
+                    lines.append(']')
+                    self.emit_lines(lines)
 
                     if data_type.has_enumerated_subtypes():
                         self._generate_enumerated_subtype_serializer(namespace, data_type)
                 self.emit('return .dictionary(output)')
             with self.deserializer_func(data_type):
                 with self.block("switch json"):
-                    dict_name = "let dict" if data_type.all_fields else "_"
+                    dict_name = "let dict" if self._all_fields(data_type) else "_"
                     self.emit("case .dictionary({}):".format(dict_name))
                     with self.indent():
                         if data_type.has_enumerated_subtypes():
@@ -344,23 +399,23 @@ class SwiftTypesBackend(SwiftBaseBackend):
         if is_void_type(data_type):
             return ''
         else:
-            return '({})'.format(fmt_type(data_type))
+            return '({})'.format(self._fmt_type(data_type))
 
     def _generate_union_type(self, namespace, data_type):
         if data_type.doc:
             doc = self.process_doc(data_type.doc, self._docf)
         else:
             doc = 'The {} union'.format(fmt_class(data_type.name))
-        self.emit_wrapped_text(doc, prefix='/// ', width=120)
+        self.emit_doc_comment(doc)
 
         class_type = fmt_class(data_type.name)
         with self.block('public enum {}: CustomStringConvertible'.format(class_type)):
-            for field in data_type.all_fields:
+            for field in self._all_fields(data_type):
                 typ = self._format_tag_type(namespace, field.data_type)
 
                 fdoc = self.process_doc(field.doc,
                     self._docf) if field.doc else 'An unspecified error.'
-                self.emit_wrapped_text(fdoc, prefix='/// ', width=120)
+                self.emit_doc_comment(fdoc)
                 self.emit('case {}{}'.format(fmt_var(field.name), typ))
             self.emit()
             with self.block('public var description: String'):
@@ -377,65 +432,73 @@ class SwiftTypesBackend(SwiftBaseBackend):
         )
 
     def _generate_union_serializer(self, data_type):
+        fields = self._all_fields(data_type)
         with self.serializer_block(data_type):
             with self.serializer_func(data_type), self.block('switch value'):
-                for field in data_type.all_fields:
-                    field_type = field.data_type
-                    case = '.{}{}'.format(fmt_var(field.name),
-                                         '' if is_void_type(field_type) else '(let arg)')
-                    self.emit('case {}:'.format(case))
-
-                    with self.indent():
-                        if is_void_type(field_type):
-                            self.emit('var d = [String: JSON]()')
-                        elif (is_struct_type(field_type) and
-                                not field_type.has_enumerated_subtypes()):
-                            self.emit('var d = Serialization.getFields({}.serialize(arg))'.format(
-                                fmt_serial_obj(field_type)))
-                        else:
-                            self.emit('var d = ["{}": {}.serialize(arg)]'.format(
-                                field.name,
-                                fmt_serial_obj(field_type)))
-                        self.emit('d[".tag"] = .str("{}")'.format(field.name))
-                        self.emit('return .dictionary(d)')
+                self.emit_lines(self._union_serializer_cases(fields))
             with self.deserializer_func(data_type):
                 with self.block("switch json"):
                     self.emit("case .dictionary(let d):")
                     with self.indent():
                         self.emit('let tag = Serialization.getTag(d)')
                         with self.block('switch tag'):
-                            for field in data_type.all_fields:
-                                field_type = field.data_type
-                                self.emit('case "{}":'.format(field.name))
-
-                                tag_type = self._tag_type(data_type, field)
-                                with self.indent():
-                                    if is_void_type(field_type):
-                                        self.emit('return {}'.format(tag_type))
-                                    else:
-                                        if (is_struct_type(field_type) and
-                                                not field_type.has_enumerated_subtypes()):
-                                            subdict = 'json'
-                                        else:
-                                            subdict = 'd["{}"] ?? .null'.format(field.name)
-
-                                        self.emit('let v = {}.deserialize({})'.format(
-                                            fmt_serial_obj(field_type), subdict
-                                        ))
-                                        self.emit('return {}(v)'.format(tag_type))
-                            self.emit('default:')
-                            with self.indent():
-                                if data_type.catch_all_field:
-                                    self.emit('return {}'.format(
-                                        self._tag_type(data_type, data_type.catch_all_field)
-                                    ))
-                                else:
-                                    self.emit('fatalError("Unknown tag \\(tag)")')
+                            self.emit_lines(self._union_deserializer_cases(data_type, fields))
                     self.emit("default:")
                     with self.indent():
 
                         self.emit('fatalError("Failed to deserialize")')
 
+    def _union_serializer_cases(self, fields):
+        """
+        Returns the lines of the `switch value` body of a union serializer,
+        relative to the indentation of the switch.
+        """
+        lines = []
+        for field in fields:
+            field_type = field.data_type
+            if is_void_type(field_type):
+                lines.append('case .%s:' % fmt_var(field.name))
+                lines.append(_case_indent + 'var d = [String: JSON]()')
+            else:
+                lines.append('case .%s(let arg):' % fmt_var(field.name))
+                if is_struct_type(field_type) and not field_type.has_enumerated_subtypes():
+                    lines.append(_case_indent + 'var d = Serialization.getFields(%s.serialize(arg))'
+                                 % self._fmt_serial_obj(field_type))
+                else:
+                    lines.append(_case_indent + 'var d = ["%s": %s.serialize(arg)]'
+                                 % (field.name, self._fmt_serial_obj(field_type)))
+            lines.append(_case_indent + 'd[".tag"] = .str("%s")' % field.name)
+            lines.append(_case_indent + 'return .dictionary(d)')
+        return lines
+
+    def _union_deserializer_cases(self, data_type, fields):
+        """
+        Returns the lines of the `switch tag` body of a union deserializer,
+        including the default case, relative to the indentation of the switch.
+        """
+        lines = []
+        for field in fields:
+            field_type = field.data_type
+            tag_type = self._tag_type(data_type, field)
+            lines.append('case "%s":' % field.name)
+            if is_void_type(field_type):
+                lines.append(_case_indent + 'return ' + tag_type)
+            else:
+                if is_struct_type(field_type) and not field_type.has_enumerated_subtypes():
+                    subdict = 'json'
+                else:
+                    subdict = 'd["%s"] ?? .null' % field.name
+                lines.append(_case_indent + 'let v = %s.deserialize(%s)'
+                             % (self._fmt_serial_obj(field_type), subdict))
+                lines.append(_case_indent + 'return %s(v)' % tag_type)
+        lines.append('default:')
+        if data_type.catch_all_field:
+            lines.append(_case_indent + 'return ' +
+                         self._tag_type(data_type, data_type.catch_all_field))
+        else:
+            lines.append(_case_indent + 'fatalError("Unknown tag \\(tag)")')
+        return lines
+
     @contextmanager
     def serializer_block(self, data_type):
         with self.class_block(fmt_class(data_type.name) + 'Serializer',
@@ -472,14 +535,16 @@ class SwiftTypesBackend(SwiftBaseBackend):
                 self.emit('namespace: \"{}\",'.format(namespace.name))
                 self.emit('deprecated: {},'.format('true' if route.deprecated
                                                    is not None else 'false'))
-                self.emit('argSerializer: {},'.format(fmt_serial_obj(route.arg_data_type)))
-                self.emit('responseSerializer: {},'.format(fmt_serial_obj(route.result_data_type)))
-                self.emit('errorSerializer: {},'.format(fmt_serial_obj(route.error_data_type)))
+                self.emit('argSerializer: {},'.format(self._fmt_serial_obj(route.arg_data_type)))
+                self.emit('responseSerializer: {},'.format(
+                    self._fmt_serial_obj(route.result_data_type)))
+                self.emit('errorSerializer: {},'.format(
+                    self._fmt_serial_obj(route.error_data_type)))
                 attrs = []
                 for field in route_schema.fields:
                     attr_key = field.name
-                    attr_val = ("\"{}\"".format(route.attrs.get(attr_key))
-                            if route.attrs.get(attr_key) else 'nil')
+                    attr_val = route.attrs.get(attr_key)
+                    attr_val = "\"{}\"".format(attr_val) if attr_val else 'nil'
                     attrs.append('\"{}\": {}'.format(attr_key, attr_val))
 
                 self.generate_multiline_list(
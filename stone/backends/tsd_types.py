@@ -1,10 +1,10 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import functools
 import json
 import os
-import re
-import six
 import sys
+import textwrap
 
 _MYPY = False
 if _MYPY:
@@ -20,16 +20,19 @@ argparse = importlib.import_module(str('argparse'))  # type: typing.Any
 
 from stone.ir import ApiNamespace
 from stone.ir import (
-    is_alias,
+    Alias,
+    Struct,
+    Union,
     is_struct_type,
-    is_union_type,
     is_user_defined_type,
     is_void_type,
     unwrap_nullable,
 )
 from stone.backend import CodeBackend
 from stone.backends.helpers import (
+    add_jobs_argument,
     fmt_pascal,
+    parallel_map,
 )
 from stone.backends.tsd_helpers import (
     fmt_polymorphic_type_reference,
@@ -96,6 +99,7 @@ _cmdline_parser.add_argument(
          'This is useful for repo which requires absolute path as '
          'module name')
 )
+add_jobs_argument(_cmdline_parser)
 _cmdline_parser.add_argument(
     '--export-namespaces',
     default=False,
@@ -137,6 +141,22 @@ interface UserMessage {
 
 _timestamp_definition = "type Timestamp = string;"
 
+# Placeholder in the template that is replaced with the generated types.
+_types_marker = '/*TYPES*/'
+
+
+@functools.lru_cache(maxsize=None)
+def _indented_types_header(spaces_per_indent, indent_level):
+    # type: (int, int) -> typing.Text
+    """
+    Returns _types_header indented to the given level, with tabs expanded to spaces.
+    """
+    indent_spaces = ' ' * (spaces_per_indent * indent_level)
+    # Blank lines are indented too, including the empty line after the final newline.
+    header = textwrap.indent(_types_header.expandtabs(spaces_per_indent), indent_spaces,
+                             lambda line: True)
+    return header + indent_spaces
+
 
 class TSDTypesBackend(CodeBackend):
     """
@@ -162,6 +182,23 @@ class TSDTypesBackend(CodeBackend):
     # Instance var to denote if one file is output for each namespace.
     split_by_namespace = False
 
+    def __init__(self, *args, **kwargs):
+        # type: (...) -> None
+        super(TSDTypesBackend, self).__init__(*args, **kwargs)
+        # Data types (including aliases) of each namespace, which do not change during a run.
+        self._data_types_cache = {}  # type: typing.Dict[ApiNamespace, typing.List[typing.Any]]
+        # Formatted type annotations, keyed on (data type, namespace of the reference).
+        self._fmt_type_cache = {}  # type: typing.Dict[typing.Tuple, typing.Text]
+        # Tags of the enumerated subtypes of each parent struct, keyed on the subtype.
+        self._subtype_tags_cache = {}  # type: typing.Dict[typing.Any, typing.Dict]
+        # Generators keyed on the exact data type class. They all take the data type, the
+        # indentation step and the extra route arguments for the type.
+        self._type_generators = {
+            Alias: self._generate_alias_type,
+            Struct: self._generate_struct_type,
+            Union: self._generate_union_type,
+        }
+
     def generate(self, api):
         extra_args = self._parse_extra_args(api, self.args.extra_arg)
         template = self._read_template()
@@ -171,12 +208,11 @@ class TSDTypesBackend(CodeBackend):
                                                  exclude_error_types=self.args.exclude_error_types)
         else:
             self.split_by_namespace = True
-            for namespace in api.namespaces.values():
-                filename = '{}.d.ts'.format(namespace.name)
-                self._generate_base_namespace_module(
-                    [namespace], filename, template,
-                    extra_args,
-                    exclude_error_types=self.args.exclude_error_types)
+            namespace_modules = self._render_namespace_modules(api, template, extra_args)
+            for namespace, namespace_module in zip(api.namespaces.values(), namespace_modules):
+                if namespace_module is not None:
+                    with self.output_to_relative_path('{}.d.ts'.format(namespace.name)):
+                        self.emit_raw(namespace_module)
 
     def _read_template(self):
         template_path = os.path.join(self.target_folder_path, self.args.template)
@@ -192,51 +228,66 @@ class TSDTypesBackend(CodeBackend):
                                         exclude_error_types=False):
 
         # Skip namespaces that do not contain types.
-        if all([len(get_data_types_for_namespace(ns)) == 0 for ns in namespace_list]):
+        if not any(self._data_types(ns) for ns in namespace_list):
             return
 
+        with self.output_to_relative_path(filename):
+            self._emit_base_namespace_module(namespace_list, template, extra_args,
+                                             exclude_error_types)
+
+    def _render_namespace_modules(self, api, template, extra_args):
+        """
+        Returns the generated file of every namespace, in namespace order, or None for
+        namespaces that do not contain types.
+        """
+        return parallel_map(
+            lambda namespace: self._render_namespace_module(namespace, template, extra_args),
+            api.namespaces.values(),
+            self.args.jobs)
+
+    def _render_namespace_module(self, namespace, template, extra_args):
+        # Skip namespaces that do not contain types.
+        if not self._data_types(namespace):
+            return None
+
+        return self.render_to_string(
+            lambda: self._emit_base_namespace_module([namespace], template, extra_args,
+                                                     self.args.exclude_error_types))
+
+    def _emit_base_namespace_module(self, namespace_list, template, extra_args,
+                                    exclude_error_types):
         spaces_per_indent = self.args.spaces_per_indent
         indent_level = self.args.indent_level
 
-        with self.output_to_relative_path(filename):
+        # /*TYPES*/
+        t_start = template.find(_types_marker)
+        if t_start == -1:
+            raise AssertionError('Missing /*TYPES*/ in TypeScript template file.')
 
-            # /*TYPES*/
-            t_match = re.search("/\\*TYPES\\*/", template)
-            if not t_match:
-                raise AssertionError('Missing /*TYPES*/ in TypeScript template file.')
-
-            t_start = t_match.start()
-            t_end = t_match.end()
-            t_ends_with_newline = template[t_end - 1] == '\n'
-            temp_end = len(template)
-            temp_ends_with_newline = template[temp_end - 1] == '\n'
-
-            self.emit_raw(template[0:t_start] + ("\n" if not t_ends_with_newline else ''))
-
-            indent = spaces_per_indent * indent_level
-            indent_spaces = (' ' * indent)
-            with self.indent(dent=indent):
-                if not exclude_error_types:
-                    indented_types_header = indent_spaces + (
-                        ('\n' + indent_spaces)
-                        .join(_types_header.split('\n'))
-                        .replace('\t', ' ' * spaces_per_indent)
-                    )
-                    self.emit_raw(indented_types_header + '\n')
-
-                if not self.split_by_namespace:
-                    self.emit(_timestamp_definition)
-                    self.emit()
-
-                for namespace in namespace_list:
-                    self._generate_types(namespace, spaces_per_indent, extra_args)
-            self.emit_raw(template[t_end + 1:temp_end] +
-                          ("\n" if not temp_ends_with_newline else ''))
+        t_end = t_start + len(_types_marker)
+
+        # The marker itself never ends with a newline, so always start the types on a new
+        # line.
+        self.emit_raw(template[:t_start] + '\n')
+
+        indent = spaces_per_indent * indent_level
+        with self.indent(dent=indent):
+            if not exclude_error_types:
+                self.emit_raw(
+                    _indented_types_header(spaces_per_indent, indent_level) + '\n')
+
+            if not self.split_by_namespace:
+                self.emit(_timestamp_definition)
+                self.emit()
+
+            for namespace in namespace_list:
+                self._generate_types(namespace, spaces_per_indent, extra_args)
+        self.emit_raw(template[t_end + 1:] + ('' if template.endswith('\n') else '\n'))
 
     def _generate_types(self, namespace, spaces_per_indent, extra_args):
         self.cur_namespace = namespace
         # Count aliases as data types too!
-        data_types = get_data_types_for_namespace(namespace)
+        data_types = self._data_types(namespace)
         # Skip namespaces that do not contain types.
         if len(data_types) == 0:
             return
@@ -264,6 +315,29 @@ class TSDTypesBackend(CodeBackend):
         self.emit('}')
         self.emit()
 
+    def _data_types(self, namespace):
+        # type: (ApiNamespace) -> typing.List[typing.Any]
+        """
+        Returns the data types and aliases of the namespace, as get_data_types_for_namespace.
+        """
+        data_types = self._data_types_cache.get(namespace)
+        if data_types is None:
+            data_types = self._data_types_cache[namespace] = get_data_types_for_namespace(
+                namespace)
+        return data_types
+
+    def _fmt_type(self, data_type, namespace):
+        # type: (typing.Any, ApiNamespace) -> typing.Text
+        """
+        Returns fmt_type(data_type, namespace), memoized. Data types and namespaces hash by
+        identity and do not change during a run.
+        """
+        key = (data_type, namespace)
+        type_str = self._fmt_type_cache.get(key)
+        if type_str is None:
+            type_str = self._fmt_type_cache[key] = fmt_type(data_type, namespace)
+        return type_str
+
     def _get_top_level_declaration(self, name):
         if self.split_by_namespace:
             # Use module for when emitting declaration files.
@@ -279,6 +353,9 @@ class TSDTypesBackend(CodeBackend):
         """
         Parses extra arguments into a map keyed on particular data types.
         """
+        if not extra_args_raw:
+            return {}
+
         extra_args = {}
 
         def invalid(msg, extra_arg_raw):
@@ -292,68 +369,85 @@ class TSDTypesBackend(CodeBackend):
             except ValueError as e:
                 invalid(str(e), extra_arg_raw)
 
+            if not isinstance(extra_arg, dict):
+                invalid('extra-arg is not a JSON object', extra_arg_raw)
+            match = extra_arg.get('match')
+            arg_name = extra_arg.get('arg_name')
+            arg_type = extra_arg.get('arg_type')
+            arg_docstring = extra_arg.get('arg_docstring')
+
             # Validate extra_arg JSON blob
             if 'match' not in extra_arg:
                 invalid('No match key', extra_arg_raw)
-            elif (not isinstance(extra_arg['match'], list) or
-                  len(extra_arg['match']) != 2):
+            elif not isinstance(match, list) or len(match) != 2:
                 invalid('match key is not a list of two strings', extra_arg_raw)
-            elif (not isinstance(extra_arg['match'][0], six.text_type) or
-                  not isinstance(extra_arg['match'][1], six.text_type)):
-                print(type(extra_arg['match'][0]))
+            elif not isinstance(match[0], str) or not isinstance(match[1], str):
                 invalid('match values are not strings', extra_arg_raw)
             elif 'arg_name' not in extra_arg:
                 invalid('No arg_name key', extra_arg_raw)
-            elif not isinstance(extra_arg['arg_name'], six.text_type):
+            elif not isinstance(arg_name, str):
                 invalid('arg_name is not a string', extra_arg_raw)
             elif 'arg_type' not in extra_arg:
                 invalid('No arg_type key', extra_arg_raw)
-            elif not isinstance(extra_arg['arg_type'], six.text_type):
+            elif not isinstance(arg_type, str):
                 invalid('arg_type is not a string', extra_arg_raw)
-            elif ('arg_docstring' in extra_arg and
-                  not isinstance(extra_arg['arg_docstring'], six.text_type)):
+            elif 'arg_docstring' in extra_arg and not isinstance(arg_docstring, str):
                 invalid('arg_docstring is not a string', extra_arg_raw)
 
-            attr_key, attr_val = extra_arg['match'][0], extra_arg['match'][1]
-            extra_args.setdefault(attr_key, {})[attr_val] = \
-                (extra_arg['arg_name'], extra_arg['arg_type'],
-                 extra_arg.get('arg_docstring'))
+            extra_args.setdefault(match[0], {})[match[1]] = (arg_name, arg_type, arg_docstring)
 
         # Extra arguments, keyed on data type objects.
         extra_args_for_types = {}
-        # Locate data types that contain extra arguments
+        # Locate data types that contain extra arguments. There are only a handful of extra
+        # arguments, so look each of them up in the route's attributes rather than scanning
+        # every attribute of every route.
+        extra_args_items = list(extra_args.items())
         for namespace in api.namespaces.values():
             for route in namespace.routes:
-                extra_parameters = []
-                if is_user_defined_type(route.arg_data_type):
-                    for attr_key in route.attrs:
-                        if attr_key not in extra_args:
-                            continue
-                        attr_val = route.attrs[attr_key]
-                        if attr_val in extra_args[attr_key]:
-                            extra_parameters.append(extra_args[attr_key][attr_val])
-                if len(extra_parameters) > 0:
-                    extra_args_for_types[route.arg_data_type] = extra_parameters
+                if not is_user_defined_type(route.arg_data_type):
+                    continue
+                attrs = route.attrs
+                matches = [(attr_key, params_by_val[attrs[attr_key]])
+                           for attr_key, params_by_val in extra_args_items
+                           if attr_key in attrs and attrs[attr_key] in params_by_val]
+                if not matches:
+                    continue
+                if len(matches) > 1:
+                    # Keep the parameters in the order of the route's attributes.
+                    attr_keys = list(attrs)
+                    matches.sort(key=lambda match: attr_keys.index(match[0]))
+                extra_args_for_types[route.arg_data_type] = [params for _, params in matches]
 
         return extra_args_for_types
 
     def _emit_tsdoc_header(self, docstring):
-        self.emit('/**')
-        self.emit_wrapped_text(self.process_doc(docstring, self._docf), prefix=' * ')
-        self.emit(' */')
+        self.emit_raw(self._tsdoc_header(docstring))
+
+    def _tsdoc_header(self, docstring):
+        """
+        Returns the TSDoc comment for the docstring at the current indentation, wrapped the same
+        way emit_wrapped_text would wrap it.
+        """
+        indent = self.make_indent()
+        prefix = indent + ' * '
+        doc = textwrap.fill(self.process_doc(docstring, self._docf),
+                            initial_indent=prefix,
+                            subsequent_indent=prefix,
+                            width=80,
+                            break_long_words=False,
+                            break_on_hyphens=False)
+        return indent + '/**\n' + doc + '\n' + indent + ' */\n'
 
     def _generate_type(self, data_type, indent_spaces, extra_args):
         """
         Generates a TypeScript type for the given type.
         """
-        if is_alias(data_type):
-            self._generate_alias_type(data_type)
-        elif is_struct_type(data_type):
-            self._generate_struct_type(data_type, indent_spaces, extra_args)
-        elif is_union_type(data_type):
-            self._generate_union_type(data_type, indent_spaces)
-
-    def _generate_alias_type(self, alias_type):
+        generate_type = self._type_generators.get(data_type.__class__)
+        if generate_type:
+            generate_type(data_type, indent_spaces, extra_args)
+
+    def _generate_alias_type(self, alias_type, indent_spaces,  # pylint: disable=unused-argument
+                             extra_parameters):  # pylint: disable=unused-argument
         """
         Generates a TypeScript type for a stone alias.
         """
@@ -367,23 +461,27 @@ class TSDTypesBackend(CodeBackend):
         Generates a TypeScript interface for a stone struct.
         """
         namespace = struct_type.namespace
+        type_name = fmt_type_name(struct_type, namespace)
         if struct_type.doc:
             self._emit_tsdoc_header(struct_type.doc)
         parent_type = struct_type.parent_type
         extends_line = ' extends %s' % fmt_type_name(parent_type, namespace) if parent_type else ''
-        self.emit('export interface %s%s {' % (fmt_type_name(struct_type, namespace), extends_line))
+        self.emit('export interface %s%s {' % (type_name, extends_line))
         with self.indent(dent=indent_spaces):
+            # Build the members of the interface first and emit them in one go.
+            indent = self.make_indent()
+            members = []
 
             for param_name, param_type, param_docstring in extra_parameters:
                 if param_docstring:
-                    self._emit_tsdoc_header(param_docstring)
+                    members.append(self._tsdoc_header(param_docstring))
                 # Making all extra args optional parameters
-                self.emit('%s?: %s;' % (param_name, param_type))
+                members.append(indent + param_name + '?: ' + param_type + ';\n')
 
             for field in struct_type.fields:
                 doc = field.doc
                 field_type, nullable = unwrap_nullable(field.data_type)
-                field_ts_type = fmt_type(field_type, namespace)
+                field_ts_type = self._fmt_type(field_type, namespace)
                 optional = nullable or field.has_default
                 if field.has_default:
                     # doc may be None. If it is not empty, add newlines
@@ -392,10 +490,13 @@ class TSDTypesBackend(CodeBackend):
                     doc = "Defaults to %s." % field.default
 
                 if doc:
-                    self._emit_tsdoc_header(doc)
+                    members.append(self._tsdoc_header(doc))
                 # Translate nullable types into optional properties.
-                field_name = '%s?' % field.name if optional else field.name
-                self.emit('%s: %s;' % (field_name, field_ts_type))
+                field_name = field.name + '?' if optional else field.name
+                members.append(indent + field_name + ': ' + field_ts_type + ';\n')
+
+            if members:
+                self.emit_raw(''.join(members))
 
         self.emit('}')
         self.emit()
@@ -406,58 +507,70 @@ class TSDTypesBackend(CodeBackend):
         # Emit a special interface that contains this extra field, and refer to it whenever we
         # encounter a reference to a type with enumerated subtypes.
         if struct_type.is_member_of_enumerated_subtypes_tree():
+            poly_name = fmt_polymorphic_type_reference(struct_type, namespace)
             if struct_type.has_enumerated_subtypes():
                 # This struct is the parent to multiple subtypes. Determine all of the possible
                 # values of the .tag property.
-                tag_values = []
-                for tags, _ in struct_type.get_all_subtypes_with_tags():
-                    for tag in tags:
-                        tag_values.append('"%s"' % tag)
-
-                tag_union = fmt_union(tag_values)
-                self._emit_tsdoc_header('Reference to the %s polymorphic type. Contains a .tag '
-                                        'property to let you discriminate between possible '
-                                        'subtypes.' % fmt_type_name(struct_type, namespace))
-                self.emit('export interface %s extends %s {' %
-                          (fmt_polymorphic_type_reference(struct_type, namespace),
-                           fmt_type_name(struct_type, namespace)))
-
-                with self.indent(dent=indent_spaces):
-                    self._emit_tsdoc_header('Tag identifying the subtype variant.')
-                    self.emit('\'.tag\': %s;' % tag_union)
-
-                self.emit('}')
-                self.emit()
+                tag_union = fmt_union(['"%s"' % tag
+                                       for tags, _ in struct_type.get_all_subtypes_with_tags()
+                                       for tag in tags])
+                self._emit_polymorphic_interface(
+                    type_name, poly_name, indent_spaces,
+                    'Reference to the %s polymorphic type. Contains a .tag property to let you '
+                    'discriminate between possible subtypes.' % type_name,
+                    'Tag identifying the subtype variant.',
+                    '\'.tag\': %s;' % tag_union)
             else:
                 # This struct is a particular subtype. Find the applicable .tag value from the
-                # parent type, which may be an arbitrary number of steps up the inheritance
-                # hierarchy.
+                # parent type. A struct without enumerated subtypes is only a member of an
+                # enumerated subtypes tree if its direct parent enumerates subtypes, so there is
+                # no need to walk further up the inheritance hierarchy.
                 parent = struct_type.parent_type
-                while not parent.has_enumerated_subtypes():
-                    parent = parent.parent_type
-                # parent now contains the closest parent type in the inheritance hierarchy that has
-                # enumerated subtypes. Determine which subtype this is.
-                for subtype in parent.get_enumerated_subtypes():
-                    if subtype.data_type == struct_type:
-                        self._emit_tsdoc_header('Reference to the %s type, identified by the '
-                                                'value of the .tag property.' %
-                                                fmt_type_name(struct_type, namespace))
-                        self.emit('export interface %s extends %s {' %
-                                  (fmt_polymorphic_type_reference(struct_type, namespace),
-                                   fmt_type_name(struct_type, namespace)))
-
-                        with self.indent(dent=indent_spaces):
-                            self._emit_tsdoc_header('Tag identifying this subtype variant. This '
-                                                    'field is only present when needed to '
-                                                    'discriminate between multiple possible '
-                                                    'subtypes.')
-                            self.emit_wrapped_text('\'.tag\': \'%s\';' % subtype.name)
-
-                        self.emit('}')
-                        self.emit()
-                        break
-
-    def _generate_union_type(self, union_type, indent_spaces):
+                # Determine which subtype this is.
+                subtype_tag = self._subtype_tag(parent, struct_type)
+                if subtype_tag is not None:
+                    # Unlike the parent's, this tag line has always been wrapped.
+                    self._emit_polymorphic_interface(
+                        type_name, poly_name, indent_spaces,
+                        'Reference to the %s type, identified by the value of the .tag '
+                        'property.' % type_name,
+                        'Tag identifying this subtype variant. This field is only present when '
+                        'needed to discriminate between multiple possible subtypes.',
+                        '\'.tag\': \'%s\';' % subtype_tag,
+                        wrap_tag=True)
+
+    def _emit_polymorphic_interface(self, type_name, poly_name, indent_spaces, docstring,
+                                    tag_docstring, tag_line, wrap_tag=False):
+        """
+        Emits the interface that extends a struct of an enumerated subtypes tree with its .tag
+        property. If wrap_tag is set, tag_line is wrapped like emit_wrapped_text would.
+        """
+        self._emit_tsdoc_header(docstring)
+        self.emit('export interface %s extends %s {' % (poly_name, type_name))
+
+        with self.indent(dent=indent_spaces):
+            self._emit_tsdoc_header(tag_docstring)
+            if wrap_tag:
+                self.emit_wrapped_text(tag_line)
+            else:
+                self.emit(tag_line)
+
+        self.emit('}')
+        self.emit()
+
+    def _subtype_tag(self, parent, struct_type):
+        """
+        Returns the tag of struct_type among the enumerated subtypes of parent, or None if it is
+        not one of them.
+        """
+        subtype_tags = self._subtype_tags_cache.get(parent)
+        if subtype_tags is None:
+            subtype_tags = self._subtype_tags_cache[parent] = {
+                subtype.data_type: subtype.name for subtype in parent.get_enumerated_subtypes()}
+        return subtype_tags.get(struct_type)
+
+    def _generate_union_type(self, union_type, indent_spaces,
+                             extra_parameters):  # pylint: disable=unused-argument
         """
         Generates a TypeScript interface for a stone union.
         """
@@ -481,7 +594,7 @@ class TSDTypesBackend(CodeBackend):
         for variant in union_type.fields:
             if variant.doc:
                 self._emit_tsdoc_header(variant.doc)
-            variant_name = '%s%s' % (union_type_name, fmt_pascal(variant.name))
+            variant_name = union_type_name + fmt_pascal(variant.name)
             variant_type_names.append(variant_name)
 
             is_struct_without_enumerated_subtypes = _is_struct_without_enumerated_subtypes(
@@ -489,7 +602,7 @@ class TSDTypesBackend(CodeBackend):
 
             if is_struct_without_enumerated_subtypes:
                 self.emit('export interface %s extends %s {' % (
-                    variant_name, fmt_type(variant.data_type, namespace)))
+                    variant_name, self._fmt_type(variant.data_type, namespace)))
             else:
                 self.emit('export interface %s {' % variant_name)
 
@@ -500,7 +613,8 @@ class TSDTypesBackend(CodeBackend):
                 if is_void_type(variant.data_type) is False and (
                     not is_struct_without_enumerated_subtypes
                 ):
-                    self.emit("%s: %s;" % (variant.name, fmt_type(variant.data_type, namespace)))
+                    variant_ts_type = self._fmt_type(variant.data_type, namespace)
+                    self.emit(variant.name + ': ' + variant_ts_type + ';')
             self.emit('}')
             self.emit()
 
@@ -2,6 +2,8 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import os
+import sys
 import unittest
 
 from stone.ir import (
@@ -24,6 +26,8 @@ from stone.backend import (
     remove_aliases_from_api,
     CodeBackend
 )
+from stone.backends.helpers import parallel_map
+from stone.backends.swift_types import SwiftTypesBackend
 
 _MYPY = False
 if _MYPY:
@@ -514,5 +518,52 @@ int sq(int x) <
         self.assertNotEqual(hash(route), hash(diff_version))
         self.assertNotEqual(hash(route), hash(diff_route))
 
+    def test_render_to_string(self):
+        t = _Tester(None, [])
+        t.emit('before')
+        self.assertEqual(t.render_to_string(lambda: t.emit('{rendered}')), '{rendered}\n')
+        self.assertEqual(t.output, [])
+
+    def test_parallel_map(self):
+        items = list(range(10))
+        for jobs in [1, 3, 20]:
+            self.assertEqual(parallel_map(lambda item: (item, item * item), items, jobs),
+                             [(item, item * item) for item in items])
+        self.assertEqual(parallel_map(lambda item: item, [], 3), [])
+
+    def test_parallel_map_worker_failures(self):
+        def fail_on_four(item):
+            if item == 4:
+                raise ValueError('bad item %d' % item)
+            return item
+
+        def exit_on_four(item):
+            if item == 4:
+                os._exit(1)
+            return item
+
+        with self.assertRaises(ValueError):
+            parallel_map(fail_on_four, range(6), 1)
+        if sys.platform.startswith('linux'):
+            with self.assertRaisesRegex(RuntimeError, 'ValueError: bad item 4'):
+                parallel_map(fail_on_four, range(6), 3)
+            with self.assertRaisesRegex(RuntimeError, 'exited without a result'):
+                parallel_map(exit_on_four, range(6), 3)
+
+    def test_swift_types_namespace_modules_with_jobs(self):
+        api = Api(version=None)
+        for ns_name in ['accounts', 'files', 'sharing', 'users']:
+            ns = api.ensure_namespace(ns_name)
+            struct = Struct('User', None, ns)
+            struct.set_attributes(None, [StructField('exists', Boolean(), None, None)])
+            ns.add_data_type(struct)
+
+        serial_backend = SwiftTypesBackend(None, [])
+        parallel_backend = SwiftTypesBackend(None, ['--jobs', '3'])
+        serial_result = serial_backend._render_namespace_modules(api)
+        self.assertEqual(parallel_backend._render_namespace_modules(api), serial_result)
+        self.assertEqual(len(serial_result), 4)
+        self.assertIn('open class Sharing', serial_result[2])
+
 if __name__ == '__main__':
     unittest.main()
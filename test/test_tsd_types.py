@@ -6,19 +6,23 @@ MYPY = False
 if MYPY:
     import typing  # noqa: F401 # pylint: disable=import-error,unused-import,useless-suppression
 
+import io
+import json
 import os
 import unittest
 import subprocess
 import sys
 import shutil
+from collections import OrderedDict
 try:
     # Works for Py 3.3+
-    from unittest.mock import Mock
+    from unittest.mock import Mock, patch
 except ImportError:
     # See https://github.com/python/mypy/issues/1153#issuecomment-253842414
-    from mock import Mock  # type: ignore
+    from mock import Mock, patch  # type: ignore
 
 from stone.ir import (
+    Api,
     ApiNamespace,
     Boolean,
     Struct,
@@ -179,6 +183,70 @@ class TestTSDTypes(unittest.TestCase):
         """)
         self.assertEqual(result, expected)
 
+    def test__render_namespace_modules_with_jobs(self):
+        # type: () -> None
+        api = Api(version=None)
+        for ns_name in ["accounts", "files", "sharing", "users", "team"]:
+            api.namespaces[ns_name] = _make_namespace(ns_name)
+        api.namespaces["empty_namespace"] = ApiNamespace("empty_namespace")
+
+        serial_backend = _make_backend(target_folder_path="output", template_path="")
+        parallel_backend = _make_backend(target_folder_path="output", template_path="",
+                                         custom_args=["--jobs=4"])
+        serial_backend.split_by_namespace = True
+        parallel_backend.split_by_namespace = True
+        serial_result = serial_backend._render_namespace_modules(api, "/*TYPES*/", {})
+        parallel_result = parallel_backend._render_namespace_modules(api, "/*TYPES*/", {})
+
+        self.assertEqual(parallel_result, serial_result)
+        self.assertEqual(len(serial_result), 6)
+        self.assertIn("declare module 'team' {", serial_result[4])
+        self.assertIsNone(serial_result[5])
+
+    def test__parse_extra_args_follows_route_attribute_order(self):
+        # type: () -> None
+        backend = _make_backend(target_folder_path="output", template_path="")
+        api = Api(version=None)
+        ns = _make_namespace()
+        arg_data_type = ns.data_types[0]
+        route = Mock()
+        route.arg_data_type = arg_data_type
+        route.attrs = OrderedDict([("style", "upload"), ("host", "content")])
+        ns.routes.append(route)
+        api.namespaces[ns.name] = ns
+
+        extra_args_raw = [
+            json.dumps({"match": ["host", "content"], "arg_name": "hostarg",
+                        "arg_type": "number"}),
+            json.dumps({"match": ["style", "upload"], "arg_name": "sel",
+                        "arg_type": "string", "arg_docstring": "Selector."}),
+        ]
+        extra_args = backend._parse_extra_args(api, extra_args_raw)
+        self.assertEqual(extra_args, {
+            arg_data_type: [("sel", "string", "Selector."), ("hostarg", "number", None)],
+        })
+
+    def test__parse_extra_args_not_an_object(self):
+        # type: () -> None
+        backend = _make_backend(target_folder_path="output", template_path="")
+        api = Api(version=None)
+        for extra_arg_raw in ['"x"', '[1]']:
+            with patch('sys.stderr', new_callable=io.StringIO) as stderr:
+                with self.assertRaises(SystemExit):
+                    backend._parse_extra_args(api, [extra_arg_raw])
+            self.assertEqual(stderr.getvalue(),
+                             'Invalid --extra-arg:extra-arg is not a JSON object: %s\n'
+                             % extra_arg_raw)
+
+    def test__parse_extra_args_without_extra_args(self):
+        # type: () -> None
+        backend = _make_backend(target_folder_path="output", template_path="")
+        # Routes must not be scanned when there are no extra arguments.
+        api = Mock()
+        api.namespaces.values.side_effect = AssertionError('routes were scanned')
+        self.assertEqual(backend._parse_extra_args(api, []), {})
+        self.assertEqual(backend._parse_extra_args(api, None), {})
+
 
 class SpecHelper:
     """